@@ -5,11 +5,12 @@ This module defines a Graph class for working with street network
 graphs using the osmnx library (OpenStreetMaps).
 """
 
-import os
 import pickle
-from typing import Any
+from pathlib import Path
+from typing import Any, Dict, Tuple
 
 import osmnx as ox
+import zstandard as zstd
 
 
 class Graph:
@@ -18,7 +19,7 @@ class Graph:
     specific location and network type ('walk' or 'drive').
 
     Class Attributes:
-        - saved_graphs_dir (str): Directory path for saving and loading graphs.
+        - saved_graphs_dir (Path): Directory for saving and loading graphs.
 
     Instance Attributes:
         - place: string in '<city>, <country>' format which represents a city.
@@ -27,16 +28,28 @@ class Graph:
         - pkl_filepath: path of the file where the graph is saved / loaded from
         - city: name of the city (extracted from the given place)
         - country: name of the country (extracted from the given place)
+        - nodes, edges, adj, pred: views of the graph attribute (bound)
 
     Hidden Methods:
         - _download_graph: Download and create a graph for a specific place.
-        - _save_graph: Save the graph attribute in a pickle file.
+        - _keep_attrs: Remove the unused attributes of a node or an edge.
+        - _save_graph: Save the graph attribute in a (compressed) pickle file.
         - _load_graph: Load the graph attribute from a pickle file.
     """
 
-    saved_graphs_dir = '/'.join(
-        os.path.abspath(__file__).split('/')[:-2]
-    ) + '/saved_graphs'
+    saved_graphs_dir = Path(__file__).resolve().parent.parent / 'saved_graphs'
+
+    # Magic number at the beginning of every Zstandard frame. Used to tell
+    # compressed pickles apart from legacy (uncompressed) ones.
+    _zstd_magic = b'\x28\xb5\x2f\xfd'
+
+    # Translation table to turn a place into (part of) a file name
+    _filename_table = str.maketrans(' ,', '__')
+
+    # Attributes of the nodes and edges that are kept after the download:
+    # coordinates of the nodes, and street name and length of the edges
+    _node_attrs = ('x', 'y')
+    _edge_attrs = ('name', 'length')
 
     def __init__(self, place: str, network_type: str) -> None:
         """
@@ -53,7 +66,8 @@ class Graph:
                 "network_type must be one of ('walk', 'drive'), "
                 f"but '{network_type}' was found instead"
             )
-        if len(place.split(',')) != 2:
+        place_parts = place.split(',')
+        if len(place_parts) != 2:
             raise ValueError(
                 "place does not follow the format '<city>, <country>'"
             )
@@ -61,13 +75,15 @@ class Graph:
         # place: query to geocode to get place boundary polygons
         self.place = place  # '<city>, <country>' format
         self.network_type = network_type  # type of street network
+        self.city, self.country = map(str.strip, place_parts)
 
         # File where the graph will be saved or loaded from
+        # NOTE: spaces and commas are replaced by '_' (in a single pass)
         self.pkl_filename = (
-                place.lower().replace(' ', '_').replace(',', '_') +
-                '_' + network_type + '.pkl'
+            place.lower().translate(self._filename_table) +
+            '_' + network_type + '.pkl'
         )
-        self.pkl_filepath = self.saved_graphs_dir + '/' + self.pkl_filename
+        self.pkl_filepath = self.saved_graphs_dir / self.pkl_filename
 
         self.graph = None
         try:
@@ -78,6 +94,13 @@ class Graph:
             self._download_graph()
             self._save_graph()
 
+        # Bind the most used views of the graph directly to the instance, so
+        # that they are found in __dict__ without falling back to __getattr__
+        self.nodes = self.graph.nodes
+        self.edges = self.graph.edges
+        self.adj = self.graph.adj
+        self.pred = self.graph.pred
+
     def _download_graph(self) -> None:
         """
         Download and create a graph within the boundaries of the given place.
@@ -96,21 +119,35 @@ class Graph:
             simplify=True  # if True, simplify graph topology
         )
 
-        # Simplify the graph: remove unnecessary information (like 'geometry')
-        # and remove multi-name streets
-        for node1, info1 in graph.nodes.items():
-            for node2, info2 in graph.adj[node1].items():
-                edge = info2[0]
-                # Remove 'geometry' (unnecessary) to free space in memory
-                if 'geometry' in edge:
-                    del edge['geometry']
-                # Deal with multi-name streets:
-                if 'name' in edge:
-                    if isinstance(edge['name'], list):
-                        # If street has several names, select the first one
-                        edge['name'] = edge['name'][0]
+        # Simplify the graph: keep only the attributes that are used (remove
+        # 'geometry', 'osmid', 'highway', etc.) and remove multi-name streets.
+        # This also makes the saved graph smaller and faster to load.
+        for _, node in graph.nodes(data=True):
+            self._keep_attrs(attrs=node, keys=self._node_attrs)
+        # NOTE that every edge (u, v, key) is visited exactly once
+        for _, _, edge in graph.edges(data=True):
+            self._keep_attrs(attrs=edge, keys=self._edge_attrs)
+            # Deal with multi-name streets:
+            name = edge.get('name')
+            if type(name) is list:
+                # If street has several names, select the first one
+                edge['name'] = name[0]
         self.graph = graph
 
+    @staticmethod
+    def _keep_attrs(attrs: Dict[str, Any], keys: Tuple[str, ...]) -> None:
+        """
+        Remove (in place) every attribute whose key is not in <keys>.
+
+        :param attrs: attributes of a node or an edge of the graph
+        :param keys: keys of the attributes to keep
+        :return: None. Updates the given attributes dictionary
+        """
+
+        kept = {key: attrs[key] for key in keys if key in attrs}
+        attrs.clear()
+        attrs.update(kept)
+
     def __getitem__(self, item: Any) -> Any:
         """
         Basically used for accessing list items.
@@ -143,18 +180,23 @@ class Graph:
         """
 
         # If the attribute is not found in the instance,
-        # try to access it from the 'graph' attribute
-        if hasattr(self.graph, name):
-            return getattr(self.graph, name)
-        else:
+        # try to access it from the 'graph' attribute. NOTE that 'graph' is
+        # read from __dict__ to avoid recursion if it is not defined yet
+        graph = self.__dict__.get('graph')
+        try:
+            return getattr(graph, name)
+        except AttributeError:
             # If the attribute is not found in both the instance and the graph,
             # raise an AttributeError
-            raise AttributeError(f"'Graph' object has no attribute '{name}'")
+            raise AttributeError(
+                f"'Graph' object has no attribute '{name}'"
+            ) from None
 
     def _save_graph(self) -> None:
         """
         Save the graph attribute in the pkl_filepath location.
         Overwrite the pkl_filepath content if it already exists.
+        The pickle (latest protocol) is compressed with Zstandard.
 
         :raise AttributeError: if graph attribute is not defined
         :return: None
@@ -163,21 +205,33 @@ class Graph:
         if self.graph is None:
             raise AttributeError('graph attribute is not defined')
 
+        compressor = zstd.ZstdCompressor(level=6)
         with open(self.pkl_filepath, 'wb+') as pkl_file:
-            pickle.dump(obj=self.graph, file=pkl_file)
-        pkl_file.close()
+            with compressor.stream_writer(pkl_file) as writer:
+                pickle.dump(
+                    obj=self.graph,
+                    file=writer,
+                    protocol=pickle.HIGHEST_PROTOCOL
+                )
 
     def _load_graph(self) -> None:
         """
         Load the graph attribute from the pkl_filepath location.
+        Both Zstandard-compressed and legacy (uncompressed) pickles are read.
 
         :raise FileNotFoundError: if pkl_filepath does not exist
         :return: None. Updates the 'graph' attribute
         """
 
         with open(self.pkl_filepath, 'rb') as pkl_file:
-            graph = pickle.load(file=pkl_file)
-        pkl_file.close()
+            is_compressed = pkl_file.read(4) == self._zstd_magic
+            pkl_file.seek(0)
+            if is_compressed:
+                decompressor = zstd.ZstdDecompressor()
+                with decompressor.stream_reader(pkl_file) as reader:
+                    graph = pickle.load(file=reader)
+            else:  # graph saved by a previous version (plain pickle)
+                graph = pickle.load(file=pkl_file)
         self.graph = graph
 
 
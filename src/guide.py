@@ -5,27 +5,205 @@ Compute the shortest route between two points in the same city
 and display the rute in a map.
 """
 
-import os
-from typing import NewType, Optional, Any, Tuple, Union, Dict, List
+import io
+import functools
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from dataclasses import dataclass
+from typing import (
+    NewType, Optional, Any, Tuple, Union, Dict, List, Sequence
+)
 
 import yaml
-import osmnx as ox
+import numpy as np
 import networkx as nx
 import staticmap as sm
-from haversine import haversine
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from sklearn.neighbors import BallTree
+from haversine import haversine, haversine_vector
 
 from src.graph import Graph
 
+# Root directory of the project
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# Use the C-accelerated YAML loader (LibYAML) when it is available
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+# Mean Earth radius in meters (same value as the haversine library), and the
+# length of one degree of a great circle
+_EARTH_RADIUS_M = 6371008.8
+_METERS_PER_DEGREE = _EARTH_RADIUS_M * np.pi / 180
 
 # Define new variable types (aliases) to make the code easier to read
-RouteLeg = NewType(
-    name='RouteLeg',
-    tp=Dict[str, Union[float, Tuple[float, float], str]]
-)  # dictionary that contains the information describing a leg of the route
 Coordinates = NewType(name='Coordinates', tp=Tuple[float, float])  # (lat, lon)
 OSMid = int  # OpenStreetMap ID
 
 
+@dataclass
+class RouteLeg:
+    """
+    A leg of the route: information describing how to go from the source
+    point (src) to the next checkpoint (mid), and how to continue to the
+    following one (dst). Slots are used to reduce the memory footprint.
+    """
+
+    __slots__ = (
+        'src', 'current_name', 'length', 'mid', 'next_name', 'dst', 'angle'
+    )
+
+    src: Coordinates  # starting point of the leg
+    current_name: Optional[str]  # name of the street from src to mid
+    length: Optional[float]  # distance from src to mid (in meters)
+    mid: Coordinates  # next checkpoint
+    next_name: Optional[str]  # name of the street from mid to dst
+    dst: Optional[Coordinates]  # None if mid is the destination point
+    angle: Optional[float]  # turning angle at mid (from -180 to 180)
+
+
+class _GraphIndex:
+    """
+    Routing data derived from a Graph: arrays of node coordinates, spatial
+    index of the streets, edge lookup, sparse matrix of edge lengths and
+    memoized shortest paths. It is built once per graph and shared by all the
+    Guide instances that work with that graph (see Guide.get_graph method).
+    """
+
+    # Max length of the pieces the edges are split into to build the spatial
+    # index of the streets (see __init__ method) [in meters]
+    _piece_length = 50.0
+
+    def __init__(self, graph: Graph) -> None:
+        """
+        Build the routing data of the given graph.
+
+        :param graph: Graph instance (of a city and network type)
+        :return: None
+        """
+
+        self.graph = graph
+        # Shortest paths are memoized per graph: (src_node, dst_node) -> route
+        self.route_cache = functools.lru_cache(maxsize=1024)(
+            self.compute_route
+        )
+        # Store the node coordinates as contiguous arrays (Structure of
+        # Arrays): row i of xy holds the (lat, lon) of the node node_ids[i]
+        n_nodes = len(graph.nodes)
+        self.node_ids = np.empty(n_nodes, dtype=np.int64)
+        self.xy = np.empty((n_nodes, 2), dtype=np.float64)
+        self.idx_of = {}
+        for idx, (node, info) in enumerate(graph.nodes(data=True)):
+            self.node_ids[idx] = node
+            self.xy[idx] = info['y'], info['x']
+            self.idx_of[node] = idx
+        # Build the spatial index of the streets (edges) once per graph. Every
+        # edge is treated as a straight segment, without direction, and split
+        # into pieces of at most _piece_length meters. The midpoints of the
+        # pieces go into a BallTree, so a segment is never farther from its
+        # nearest piece midpoint than half a piece, however long the street
+        # is (see Guide._get_nearest_node method).
+        # NOTE that the BallTree uses the haversine metric, which expects
+        # (lat, lon) in radians.
+        segments = {
+            (min(iu, iv), max(iu, iv))
+            for iu, iv in (
+                (self.idx_of[u], self.idx_of[v]) for u, v in graph.edges()
+            )
+            if iu != iv  # skip self-loops
+        }
+        # Row indices (in xy) of the extreme nodes of every segment
+        self.segments = np.array(sorted(segments), dtype=np.int64)
+        self.segments = self.segments.reshape(-1, 2)
+        self.piece_segment = np.empty(0, dtype=np.int64)
+        self.piece_tree = None
+        self.max_half_piece = 0.0  # [in meters]
+        if len(self.segments):
+            a, b = self.xy[self.segments[:, 0]], self.xy[self.segments[:, 1]]
+            seg_lengths = haversine_vector(a, b, unit='m')
+            n_pieces = np.maximum(
+                np.ceil(seg_lengths / self._piece_length), 1
+            ).astype(np.int64)
+            # Segment of every piece, and position of its midpoint along the
+            # segment: (j + 0.5) / n for the j-th of the n pieces
+            self.piece_segment = np.repeat(np.arange(len(n_pieces)), n_pieces)
+            first_piece = np.repeat(np.cumsum(n_pieces) - n_pieces, n_pieces)
+            j = np.arange(len(self.piece_segment)) - first_piece
+            t = (j + 0.5) / n_pieces[self.piece_segment]
+            midpoints = (
+                a[self.piece_segment] +
+                t[:, None] * (b - a)[self.piece_segment]
+            )
+            self.piece_tree = BallTree(
+                np.deg2rad(midpoints), metric='haversine'
+            )
+            self.max_half_piece = float(np.max(seg_lengths / n_pieces)) / 2
+        # Flat lookup of the edge between every pair of nodes, to skip the
+        # triple indexing graph[u][v][key] of the MultiDiGraph.
+        # If two nodes are linked by several edges, keep the shortest one:
+        # the one followed by the shortest paths (see the lengths matrix)
+        self.edge_data = {}
+        for u, v, data in graph.edges(data=True):
+            best = self.edge_data.get((u, v))
+            if best is None or data['length'] < best['length']:
+                self.edge_data[(u, v)] = data
+        # Sparse (CSR) adjacency matrix of the graph weighted by the length of
+        # the edges (in edge_data), used to compute the shortest paths in
+        # compiled code
+        rows = [self.idx_of[u] for u, _ in self.edge_data]
+        cols = [self.idx_of[v] for _, v in self.edge_data]
+        self.lengths = csr_matrix(
+            (
+                np.fromiter(
+                    (data['length'] for data in self.edge_data.values()),
+                    dtype=np.float64, count=len(self.edge_data)
+                ),
+                (rows, cols)
+            ),
+            shape=(n_nodes, n_nodes)
+        )
+
+    def compute_route(
+            self,
+            src_node: OSMid,
+            dst_node: OSMid
+    ) -> Tuple[OSMid, ...]:
+        """
+        Compute the shortest path between two nodes of the graph.
+        Dijkstra's algorithm (SciPy, compiled code) is run on the sparse
+        matrix of edge lengths (see __init__ method).
+        The result is returned as a tuple (immutable) so that it can be safely
+        memoized by the route cache (see __init__ method).
+
+        :param src_node: Starting node for path (OpenStreetMap ID)
+        :param dst_node: Ending node for path (OpenStreetMap ID)
+        :raise NetworkXNoPath: if dst_node is not reachable from src_node
+        :return: Sequence of OpenStreetMap IDs from src_node to dst_node
+        """
+
+        src_idx, dst_idx = self.idx_of[src_node], self.idx_of[dst_node]
+        # Dijkstra's algorithm from the source node (compiled, SciPy)
+        _, predecessors = dijkstra(
+            csgraph=self.lengths,
+            directed=True,
+            indices=src_idx,
+            return_predecessors=True
+        )
+        if src_idx != dst_idx and predecessors[dst_idx] < 0:
+            raise nx.NetworkXNoPath(
+                f'Node {dst_node} not reachable from {src_node}'
+            )
+
+        # Walk the predecessors back from the destination to the source
+        route_idx = [dst_idx]
+        while route_idx[-1] != src_idx:
+            route_idx.append(predecessors[route_idx[-1]])
+        route = self.node_ids[route_idx[::-1]].tolist()
+        return tuple(route)
+
+
 class Guide:
     """
     Guide Class. A class for computing the shortest route between two points
@@ -33,14 +211,22 @@ class Guide:
     """
 
     # Directory where the icons (part of the route) are stored
-    route_images_dir = '/'.join(
-        os.path.abspath(__file__).split('/')[:-2]
-    ) + '/route_images'
+    route_images_dir = _PROJECT_DIR / 'route_images'
 
     # Directory containing the icons to display on the map
-    icons_dir = '/'.join(
-        os.path.abspath(__file__).split('/')[:-2]
-    ) + '/icons'
+    icons_dir = _PROJECT_DIR / 'icons'
+
+    # Graphs (and their routing data) shared by all the Guide instances:
+    # (place, network type) -> _GraphIndex. Only the most recently used ones
+    # are kept in memory (LRU), the rest are loaded again from disk if needed
+    _graph_cache: Dict[Tuple[str, str], _GraphIndex] = OrderedDict()
+    _graph_cache_size = 4
+    # _graph_cache_lock guards the cache (it is held for short operations),
+    # and there is one more lock per graph being loaded (held while the graph
+    # is loaded or downloaded), so that every graph is only loaded once, but
+    # different graphs are loaded at the same time
+    _graph_cache_lock = threading.Lock()
+    _graph_load_locks: Dict[Tuple[str, str], threading.Lock] = {}
 
     def __init__(self) -> None:
         """
@@ -54,7 +240,12 @@ class Guide:
         self.country = None
         self.graph = None  # Call get_graph method to fetch the graph of a city
         self._icon_filename = None  # Updated when get_graph is called
-        self.config = self._get_config()  # Get the configuration params
+        self._index = None  # Routing data of the graph (see get_graph)
+        # Serializes the switches of graph (see get_graph). NOTE that readers
+        # take a snapshot of _index instead, so they never wait for a switch
+        self._switch_lock = threading.Lock()
+        # Get the configuration params (copy: the parsed config is shared)
+        self.config = dict(self._get_config())
 
     def get_graph(self, place: str, walk_or_drive: str = 'drive') -> None:
         """
@@ -65,47 +256,168 @@ class Guide:
         :return: None. Updates the <graph> attribute.
         """
 
-        self.city = place.split(',')[0].strip()
-        self.country = place.split(',')[1].strip()
-        self.graph = Graph(place=place, network_type=walk_or_drive)
-        # Select icon (person or car) depending on the network type
+        if self.has_graph(place=place, walk_or_drive=walk_or_drive):
+            return  # this guide already works with the requested graph
+
+        index = self._get_index(place=place, walk_or_drive=walk_or_drive)
+        icon_filename = self._get_icon_filename(walk_or_drive=walk_or_drive)
+
+        # Publish the new graph once all its data is ready. Methods running
+        # in other threads (e.g. get_directions) read the _index attribute
+        # only once, so they always work with a consistent graph
+        with self._switch_lock:
+            self._index = index
+            self._icon_filename = icon_filename
+            self.city, self.country = index.graph.city, index.graph.country
+            self.graph = index.graph
+
+    def has_graph(self, place: str, walk_or_drive: str = 'drive') -> bool:
+        """
+        Check whether the graph of this guide is the one of the given place
+        and network type (see get_graph method), and it is ready to be used.
+
+        NOTE that the published routing data (_index) is checked instead of
+        the graph attribute: it is only set once the spatial index, the edge
+        lookup, the length matrix and the route cache of the graph are built.
+
+        :param place: '<city>, <country>' format. Query to get the graph.
+        :param walk_or_drive: network type. 'walk' or 'drive'. For the graph.
+        :return: True if the requested graph is ready to compute routes
+        """
+
+        index = self._index  # a single read: consistent even during a switch
+        return (
+            index is not None
+            and index.graph.place == place
+            and index.graph.network_type == walk_or_drive
+        )
+
+    @classmethod
+    def load_graph(cls, place: str, walk_or_drive: str = 'drive') -> None:
+        """
+        Load (or download) the graph of the given place into the cache shared
+        by all the Guides, without making it the graph of any of them. Routes
+        on it can be computed with get_directions(..., place=place).
+
+        :param place: '<city>, <country>' format. Query to get the graph.
+        :param walk_or_drive: network type. 'walk' or 'drive'. For the graph.
+        :return: None
+        """
+
+        cls._get_index(place=place, walk_or_drive=walk_or_drive)
+
+    @classmethod
+    def is_graph_loaded(
+            cls,
+            place: str,
+            walk_or_drive: str = 'drive'
+    ) -> bool:
+        """
+        Check whether the graph of the given place is in the cache shared by
+        all the Guides (see load_graph method), ready to compute routes.
+
+        :param place: '<city>, <country>' format. Query to get the graph.
+        :param walk_or_drive: network type. 'walk' or 'drive'. For the graph.
+        :return: True if the requested graph is loaded
+        """
+
+        with cls._graph_cache_lock:
+            return (place, walk_or_drive) in cls._graph_cache
+
+    @classmethod
+    def _get_index(cls, place: str, walk_or_drive: str) -> _GraphIndex:
+        """
+        Get the routing data of the graph of the given place and network type.
+        Load (or download) the graph and build its routing data only once, and
+        share them among Guides (and among switches between cities).
+
+        :param place: '<city>, <country>' format. Query to get the graph.
+        :param walk_or_drive: network type. 'walk' or 'drive'. For the graph.
+        :return: routing data of the requested graph
+        """
+
+        key = (place, walk_or_drive)
+        with cls._graph_cache_lock:
+            index = cls._graph_cache.get(key)
+            if index is not None:
+                cls._graph_cache.move_to_end(key)  # most recently used
+                return index
+            load_lock = cls._graph_load_locks.setdefault(
+                key, threading.Lock()
+            )
+
+        with load_lock:
+            # Check again: the graph may have been loaded in another thread
+            # while waiting for the lock
+            with cls._graph_cache_lock:
+                index = cls._graph_cache.get(key)
+            if index is not None:
+                return index
+            try:
+                index = _GraphIndex(
+                    graph=Graph(place=place, network_type=walk_or_drive)
+                )
+            except Exception:  # the graph could not be loaded
+                with cls._graph_cache_lock:
+                    cls._graph_load_locks.pop(key, None)
+                raise
+            with cls._graph_cache_lock:
+                cls._graph_cache[key] = index
+                cls._graph_load_locks.pop(key, None)
+                # Drop the least recently used graphs
+                while len(cls._graph_cache) > cls._graph_cache_size:
+                    cls._graph_cache.popitem(last=False)
+        return index
+
+    def _get_icon_filename(self, walk_or_drive: str) -> str:
+        """
+        Select the icon (person or car) depending on the network type.
+
+        :param walk_or_drive: network type. 'walk' or 'drive'.
+        :return: file name of the icon (in the icons directory)
+        """
+
         if walk_or_drive == 'walk':
-            self._icon_filename = self.config['person_icon_filename']
-        else:  # walk_or_drive == 'drive'
-            self._icon_filename = self.config['car_icon_filename']
+            return self.config['person_icon_filename']
+        return self.config['car_icon_filename']  # walk_or_drive == 'drive'
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def _get_config() -> Dict[str, Any]:
         """
         Read the configuration file and return it as a python dictionary.
         The configuration file is named 'config/config.yml'
+        The file is parsed only once (the result is cached at class level).
 
         :return: configuration dictionary
         """
 
-        this_file_path = os.path.abspath(__file__)
-        this_project_dir_path = '/'.join(this_file_path.split('/')[:-2])
-
-        config_path = this_project_dir_path + '/config/config.yml'
+        config_path = _PROJECT_DIR / 'config' / 'config.yml'
 
         with open(config_path, 'r') as yml_file:
-            config = yaml.safe_load(yml_file)[0]['config']
+            config = yaml.load(yml_file, Loader=_YamlLoader)[0]['config']
         return config
 
     def get_directions(
             self,
             src_coords: Coordinates,
-            dst_coords: Coordinates
+            dst_coords: Coordinates,
+            place: Optional[str] = None,
+            walk_or_drive: str = 'drive'
     ) -> List[RouteLeg]:
         """
         Compute the directions for the shortest route between source and
         destination coordinates. We call it a 'route', and every route is
-        formed by a sequence of legs. Each leg is a python dictionary with
+        formed by a sequence of legs. Each leg is a RouteLeg instance with
         information about how to reach the next checkpoint of the route, and it
         is linked to the previous and the next legs.
 
         :param src_coords: (latitude, longitude) source coordinates (first)
         :param dst_coords: (latitude, longitude) destination coordinates (last)
+        :param place: '<city>, <country>'. Compute the route on the graph of
+            this place (see load_graph method) instead of the graph of this
+            guide (see get_graph method).
+        :param walk_or_drive: network type of the graph of the given place
         :return: Sequence of steps and guides (legs) that form a route
         """
 
@@ -113,35 +425,49 @@ class Guide:
         # to operate with the graph, we need to use its nodes.
         # First of all, let's find the nearest nodes to the points src_coords
         # and dst_coords.
-        src_node = self._get_nearest_node(coords=src_coords)
-        dst_node = self._get_nearest_node(coords=dst_coords)
+        # NOTE that a snapshot of the routing data is used during the whole
+        # computation, even if the graph is switched in another thread
+        if place is None:
+            index = self._index
+        else:
+            index = self._get_index(place=place, walk_or_drive=walk_or_drive)
+        src_node = self._get_nearest_node(index=index, coords=src_coords)
+        dst_node = self._get_nearest_node(index=index, coords=dst_coords)
         # NOTE that a Node is represented by its OpenStreetMap (OSM) ID [int]
 
-        # Compute the shortest path between src_node and dst_node in the graph
-        route = nx.shortest_path(
-            G=self.graph.graph,  # A NetworkX Graph instance
-            source=src_node,  # Starting node for path (source)
-            target=dst_node  # Ending node for path (destination)
-        )
+        # Get the shortest path between src_node and dst_node in the graph.
+        # NOTE that the cached route (tuple) must not be modified.
+        path = index.route_cache(src_node, dst_node)
+        # Gather the (lat, lon) coordinates of all the nodes of the path at
+        # once, and compute the turning angles at every intermediate node of
+        # the path (vectorized): angles[j] is the angle at the node path[j+1]
+        path_xy = index.xy[[index.idx_of[node] for node in path]]
+        angles = self._compute_angles(points=path_xy)
         # NOTE that the actual src and dst points (coordinates) are not
-        # included in the route yet because they are not nodes of the graph
+        # included in the path because they are not nodes of the graph
 
-        # Now, insert the src_coords and the dst_coords at the beginning and
-        # the end of the route, respectively. Now. the route is complete.
-        route.insert(0, src_coords)
-        route.append(dst_coords)
+        # Build the complete route in one go: the src_coords and the dst_coords
+        # at the beginning and the end of the path, respectively.
         # NOTE that the first and last elements are coordinate points, whereas
         # the intermediate elements are OMS IDs (nodes of the graph)
-        route.append(None)  # indicator of the end of the route
+        # NOTE that None is the indicator of the end of the route
+        route = [src_coords, *path, dst_coords, None]
+        # Coordinates of every element of the route (but the None indicator)
+        points = [src_coords, *map(tuple, path_xy.tolist()), dst_coords]
 
         # Define the directions: instructions to go grom the src to the dst
         # Compute the legs of the route, and add info like street name or angle
         directions = []
         for i in range(len(route)-2):
             next_leg = self._compute_leg_of_the_route(
-                src=route[i], mid=route[i+1], dst=route[i+2]
+                index=index,
+                src=route[i], mid=route[i+1], dst=route[i+2],
+                points=points[i:i+3]
             )
             directions.append(next_leg)
+        # The i-th leg (0 < i < len(route)-1) goes through the i-th node
+        for i, angle in enumerate(angles, start=1):
+            directions[i].angle = float(angle)
 
         # Post-processing step: when the destination is found between the last
         # node and the penultimate node, we can skip the last node and go
@@ -152,24 +478,27 @@ class Guide:
             # destination point.
             penult_leg = directions[-2]
             # Compute distances between the penultimate and last nodes with
-            # respect of the destination point
-            penult_dist = haversine(penult_leg['src'], penult_leg['dst'])
-            last_dist = haversine(penult_leg['mid'], penult_leg['dst'])
+            # respect of the destination point (in a single vectorized call)
+            penult_dist, last_dist = haversine_vector(
+                np.broadcast_to(penult_leg.dst, (2, 2)),
+                np.array([penult_leg.src, penult_leg.mid])
+            )
             # If the penultimate node is closer to the destination,
             if penult_dist > last_dist:
                 # The penultimate leg will become the last leg, and will go
                 # from the penultimate node to the destination point (skipping
                 # the last node)
-                directions[-2]['mid'] = directions[-2]['dst']
-                directions[-2]['dst'] = None
-                directions[-2]['length'] = haversine(
-                    directions[-2]['src'], directions[-2]['mid'], unit='m'
+                penult_leg.mid = penult_leg.dst
+                penult_leg.dst = None
+                penult_leg.length = haversine(
+                    penult_leg.src, penult_leg.mid, unit='m'
                 )
                 directions.pop()  # the last leg is skipped, remove it.
 
         return directions
 
-    def _get_nearest_node(self, coords: Coordinates) -> OSMid:
+    @staticmethod
+    def _get_nearest_node(index: _GraphIndex, coords: Coordinates) -> OSMid:
         """
         Given a pair of coordinates (latitude, longitude), find the nearest
         node in the graph attribute. Return the OpenStreetMap ID of that node.
@@ -179,167 +508,216 @@ class Guide:
         edge. WHY? Because the priority is to go from the source point (coords)
         to the closest street (edge), not to the closes corner (node)
 
-        Haversine (or great circle) distance:
-        It's the angular distance between two points on the surface of a sphere
+        The nearest edge is found with the spatial index of the streets (built
+        once per graph, see _GraphIndex): the edge of the nearest piece gives
+        an upper bound of the distance to the nearest edge, and every edge
+        within that bound has a piece midpoint within the bound plus half a
+        piece. Edges are treated as straight segments between their nodes.
 
+        :param index: routing data of the graph (see get_graph method)
         :param coords: (latitude, longitude) geographic coordinates
         :return: OpenStreetMap ID of the nearest node in the graph attribute.
         """
 
-        nearest_edge = ox.distance.nearest_edges(
-            G=self.graph.graph, X=coords[1], Y=coords[0]
+        if index.piece_tree is None:  # the graph has no edges
+            dist = np.hypot(*(index.xy - np.asarray(coords)).T)
+            return int(index.node_ids[np.argmin(dist)])
+
+        point = np.deg2rad([coords])
+        # Upper bound: distance to the edge of the nearest piece midpoint
+        _, nearest_piece = index.piece_tree.query(point, k=1)
+        first = index.piece_segment[nearest_piece[0, 0]]
+        bound = Guide._segment_distances(
+            index=index, coords=coords, segments=np.array([first])
+        )[0][0]
+        # Candidate edges: the ones with a piece midpoint within the bound
+        # plus half a piece (plus a small margin for the projection)
+        radius = (bound + index.max_half_piece) * 1.01 + 1.0  # [in meters]
+        pieces = index.piece_tree.query_radius(
+            point, r=radius / _EARTH_RADIUS_M
+        )[0]
+        candidates = np.union1d(index.piece_segment[pieces], [first])
+        dist, du, dv = Guide._segment_distances(
+            index=index, coords=coords, segments=candidates
         )
-        u, v, _ = nearest_edge
-        point_u = (self.graph.nodes[u]['y'], self.graph.nodes[u]['x'])
-        point_v = (self.graph.nodes[v]['y'], self.graph.nodes[v]['x'])
+        nearest = int(np.argmin(dist))
 
-        du, dv = haversine(coords, point_u), haversine(coords, point_v)
-        return u if du == min(du, dv) else v
+        # The nearest of the two extreme nodes of the nearest edge
+        iu, iv = index.segments[candidates[nearest]]
+        nearest_idx = iu if du[nearest] <= dv[nearest] else iv
+        return int(index.node_ids[nearest_idx])
 
-    def _get_coordinates(self, node: OSMid) -> Coordinates:
+    @staticmethod
+    def _segment_distances(
+            index: _GraphIndex,
+            coords: Coordinates,
+            segments: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        Given a node represented by an OpenStreetMap ID (OMD id), use the graph
-        information to compute the coordinates (latitude, longitude)
+        Compute the distances from the given point to the given segments (see
+        _GraphIndex), and to their extreme nodes, in a local equirectangular
+        projection centered at the point (precise enough at street scale).
 
-        :param node: OpenStreetMap ID
-        :return: (latitude, longitude) geographic coordinates
+        :param index: routing data of the graph (see get_graph method)
+        :param coords: (latitude, longitude) geographic coordinates
+        :param segments: indices of the segments (rows of index.segments)
+        :return: distances to the segments, to their first nodes, and to their
+            second nodes [in meters]
         """
 
-        latitude = self.graph.nodes[node]['y']
-        longitude = self.graph.nodes[node]['x']
-        return latitude, longitude
+        origin = np.asarray(coords, dtype=np.float64)
+        scale = _METERS_PER_DEGREE * np.array(
+            [1.0, np.cos(np.deg2rad(origin[0]))]
+        )
+        a = (index.xy[index.segments[segments, 0]] - origin) * scale
+        b = (index.xy[index.segments[segments, 1]] - origin) * scale
+        # Closest point of every segment (a, b) to the origin
+        ab = b - a
+        ab_sq = np.einsum('ij,ij->i', ab, ab)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(
+                ab_sq > 0, -np.einsum('ij,ij->i', a, ab) / ab_sq, 0.0
+            )
+        closest = a + np.clip(t, 0.0, 1.0)[:, None] * ab
+        return np.hypot(*closest.T), np.hypot(*a.T), np.hypot(*b.T)
 
+    @staticmethod
     def _compute_leg_of_the_route(
-            self,
-            src: Union[RouteLeg, OSMid],
-            mid: Union[RouteLeg, OSMid],
-            dst: Union[RouteLeg, OSMid],
+            index: _GraphIndex,
+            src: Union[Coordinates, OSMid],
+            mid: Union[Coordinates, OSMid],
+            dst: Union[Coordinates, OSMid, None],
+            points: Sequence[Coordinates]
     ) -> RouteLeg:
         """
         Compute information about a leg of the route.
 
+        :param index: routing data of the graph (see get_graph method)
         :param src: Source coordinates or OpenStreetMap ID
         :param mid: Intermediate coordinates or OpenStreetMap ID
         :param dst: Destination coordinates or OpenStreetMap ID
-        :return: Dictionary containing information about the leg
+        :param points: Coordinates of src, mid and dst (if dst is not None)
+        :return: RouteLeg instance containing information about the leg
         """
 
         # Values by default (will be changed within this function)
-        leg = {
-            'src': src,
-            'current_name': None,
-            'length': None,
-            'mid': mid,
-            'next_name': None,
-            'dst': dst,
-            'angle': None
-        }
+        current_name, length, next_name = None, None, None
 
         if dst is None:  # Last Step: from the last node to the dst point
-            # no angle, no street name. Just turn every OSM id to coordinates.
-            if isinstance(src, OSMid):
-                leg['src'] = self._get_coordinates(node=src)
-            return leg
+            # no angle, no street name.
+            return RouteLeg(
+                src=points[0], current_name=None, length=None, mid=points[1],
+                next_name=None, dst=None, angle=None
+            )
 
         if isinstance(src, OSMid):  # All but the First Step.
             # Get the street name and distance (length)
-            leg['src'] = self._get_coordinates(node=src)
-            leg['current_name'] = self.graph[src][mid][0].get('name', None)
-            leg['length'] = self.graph[src][mid][0].get('length', None)
-
-        # MID will be always a node of the graph
-        leg['mid'] = self._get_coordinates(node=mid)
+            edge = index.edge_data[(src, mid)]
+            current_name = edge.get('name', None)
+            length = edge.get('length', None)
 
         if isinstance(dst, OSMid):  # All but the Penultimate Step
-            leg['dst'] = self._get_coordinates(node=dst)
-            leg['next_name'] = self.graph[mid][dst][0].get('name', None)
+            next_name = index.edge_data[(mid, dst)].get('name', None)
 
-        # If the angle can be computed, do it
-        if isinstance(src, OSMid) and isinstance(dst, OSMid):
-            leg['angle'] = self._compute_angle(
-                src_node=src, mid_node=mid, dst_node=dst
-            )
+        # NOTE that the angle is computed for the whole route at once in the
+        # get_directions method (see _compute_angles method)
 
-        return leg
+        return RouteLeg(
+            src=points[0], current_name=current_name, length=length,
+            mid=points[1], next_name=next_name, dst=points[2], angle=None
+        )
 
-    def _compute_angle(
-            self,
-            src_node: OSMid,
-            mid_node: OSMid,
-            dst_node: OSMid
-    ) -> float:
+    @staticmethod
+    def _compute_angles(points: np.ndarray) -> np.ndarray:
         """
-        Compute the angle between three nodes on the route.
-        Returns the angle between the lines (src,mid) and (mid,dst)
+        Compute the angles formed at every intermediate point of the route.
+        The i-th angle is the angle between the lines (points[i], points[i+1])
+        and (points[i+1], points[i+2]), in the range from -180 to 180.
 
-        :param src_node: Source node (OpenStreetMap ID)
-        :param mid_node: Intermediate node (OpenStreetMap ID)
-        :param dst_node: Destination node (OpenStreetMap ID)
-        :return: Angle between the three nodes
+        The bearings of all the segments are computed in a single NumPy
+        operation (same formula as osmnx.bearing.calculate_bearing).
+
+        :param points: (lat, lon) coordinates of the route, shape (N, 2)
+        :return: Array with N-2 angles (in degrees)
         """
 
-        src_coords = self._get_coordinates(node=src_node)
-        mid_coords = self._get_coordinates(node=mid_node)
-        dst_coords = self._get_coordinates(node=dst_node)
+        if len(points) < 3:  # there are no intermediate points
+            return np.empty(0, dtype=np.float64)
 
-        angle1 = ox.bearing.calculate_bearing(*src_coords, *mid_coords)
-        angle2 = ox.bearing.calculate_bearing(*mid_coords, *dst_coords)
-        angle = angle2 - angle1
+        lat, lon = np.deg2rad(points).T
+        lat1, lat2 = lat[:-1], lat[1:]
+        delta_lon = lon[1:] - lon[:-1]
 
-        if abs(angle) < 180:
-            return angle
-        return angle + 360 if angle < 0 else angle - 360
+        # Bearing (in degrees) of every segment of the route
+        bearings = np.degrees(np.arctan2(
+            np.sin(delta_lon) * np.cos(lat2),
+            np.cos(lat1) * np.sin(lat2) -
+            np.sin(lat1) * np.cos(lat2) * np.cos(delta_lon)
+        )) % 360
+        # Difference between consecutive bearings, normalized to [-180, 180)
+        return (bearings[1:] - bearings[:-1] + 180) % 360 - 180
 
     def plot_directions(
             self,
             directions: List[RouteLeg],
             current_leg: int,
             size: Tuple[int, int] = (400, 400),
-            file_name: Optional[str] = None
-    ) -> Optional[str]:
+            file_name: Optional[str] = None,
+            walk_or_drive: Optional[str] = None
+    ) -> Union[str, bytes]:
         """
-        Plot the directions on a map.
+        Plot the directions on a map. If no file name is given, the image is
+        not written to disk: the PNG bytes are returned instead (in memory).
 
         :param directions: List of route legs
         :param current_leg: Index of the current leg being plotted
         :param size: Size of the map (width, height). Default (400, 400)
-        :param file_name: Name of the file to save the map
-        :return: None
+        :param file_name: [Optional] Name of the file to save the map
+        :param walk_or_drive: [Optional] network type of the route, to select
+            the icon. By default, the one of the graph of this guide.
+        :return: path of the saved image, or the PNG image (bytes)
         """
 
         map_ = sm.StaticMap(*size)
-        # Display the part of the route that is already done
-        for leg_idx, leg in enumerate(directions):
-            if leg_idx < current_leg:
-                line_color_ = self.config['done_route_color']
-            else:
-                line_color_ = self.config['remaining_route_color']
-
-            # Swaps the coordinates because StaticMap requires so.
-            _src_coords = leg['src'][1], leg['src'][0]
-            _dst_coords = leg['mid'][1], leg['mid'][0]
-            line_ = sm.Line(
-                coords=(_src_coords, _dst_coords),
-                color=line_color_,
-                width=self.config['line_width'],
-            )
-            map_.add_line(line_)
-            circle_marker_ = sm.CircleMarker(
-                coord=_src_coords,
-                color=self.config['intermediate_points_color'],
-                width=self.config['intermediate_circles_radius']
-            )
-            map_.add_marker(circle_marker_)
+        # Points of the route in order: the src of every leg plus the last
+        # checkpoint (destination). Swap the coordinates at once (lon, lat)
+        # because StaticMap requires so.
+        points = np.array(
+            [leg.src for leg in directions] + [directions[-1].mid]
+        )[:, ::-1].tolist()
+        points = [tuple(point) for point in points]
+
+        # Consecutive legs are linked (the mid of a leg is the src of the next
+        # one), so each part of the route is drawn as a single polyline.
+        line_width_ = self.config['line_width']
+        if current_leg > 0:  # Display the part of the route that is done
+            map_.add_line(sm.Line(
+                coords=points[:current_leg+1],
+                color=self.config['done_route_color'],
+                width=line_width_
+            ))
+        if current_leg < len(directions):  # Display the remaining part
+            map_.add_line(sm.Line(
+                coords=points[current_leg:],
+                color=self.config['remaining_route_color'],
+                width=line_width_
+            ))
+        # Add a marker (circle) at the beginning of every leg
+        circle_color_ = self.config['intermediate_points_color']
+        circle_radius_ = self.config['intermediate_circles_radius']
+        for point in points[:-1]:
+            map_.add_marker(sm.CircleMarker(
+                coord=point, color=circle_color_, width=circle_radius_
+            ))
 
         # Add initial and last markers (circles)
-        src_coords = directions[0]['src'][1], directions[0]['src'][0]
+        src_coords, dst_coords = points[0], points[-1]
         src_circle_marker = sm.CircleMarker(
             coord=src_coords,
             color=self.config['source_point_color'],
             width=self.config['source_circle_radius']
         )
         map_.add_marker(src_circle_marker)
-        dst_coords = directions[-1]['mid'][1], directions[-1]['mid'][0]
         dst_circle_marker = sm.CircleMarker(
             coord=dst_coords,
             color=self.config['destination_point_color'],
@@ -347,20 +725,16 @@ class Guide:
         )
         map_.add_marker(dst_circle_marker)
 
-        # Add the person or car icon in the current coordinates
-        if current_leg < len(directions):
-            current_coords = (
-                directions[current_leg]['src'][1],
-                directions[current_leg]['src'][0]
-            )
-        else:  # current_leg == len(directions)
-            current_coords = (
-                directions[current_leg-1]['mid'][1],
-                directions[current_leg-1]['mid'][0]
-            )
+        # Add the person or car icon in the current coordinates: the src of
+        # the current leg, or the destination if the route is over
+        current_coords = points[current_leg]
+        if walk_or_drive is None:
+            icon_filename = self._icon_filename
+        else:
+            icon_filename = self._get_icon_filename(walk_or_drive)
         current_icon = sm.IconMarker(
             coord=current_coords,
-            file_path=self.icons_dir + '/' + self._icon_filename,
+            file_path=self.icons_dir / icon_filename,
             offset_x=10,
             offset_y=20
         )
@@ -370,19 +744,22 @@ class Guide:
         destination_icon = sm.IconMarker(
             coord=dst_coords,
             file_path=(
-                self.icons_dir + '/' + self.config['destination_icon_filename']
+                self.icons_dir / self.config['destination_icon_filename']
             ),
             offset_x=10,
             offset_y=30
         )
         map_.add_marker(destination_icon)
 
-        # Render and save the image
+        # Render and save the image (or keep it in memory)
         image = map_.render()
         if file_name is not None:
-            img_filepath = self.route_images_dir + '/' + file_name
+            img_filepath = self.route_images_dir / file_name
             image.save(img_filepath)
-            return img_filepath
+            return str(img_filepath)
+        with io.BytesIO() as img_buffer:
+            image.save(img_buffer, format='PNG')
+            return img_buffer.getvalue()
 
 
 if __name__ == '__main__':
@@ -6,21 +6,108 @@ guide you to wherever you want. Use the /help command to know more on the
 available commands.
 """
 
-import os
-from datetime import datetime
-from typing import NewType, Optional, Any, Tuple, Dict
-
+import math
+import asyncio
+import weakref
+import functools
+from pathlib import Path
+from dataclasses import dataclass
+from typing import (
+    NewType, Optional, Any, Tuple, Dict, List, Awaitable, Callable, Sequence
+)
+
+import numpy as np
+
+from geopy.exc import GeopyError, GeocoderQueryError
 from geopy.geocoders import Photon
+from networkx import NetworkXNoPath
 from haversine import haversine
 from telegram import Update
-from telegram.ext import ContextTypes, Application, \
+from telegram.ext import ContextTypes, Application, BaseUpdateProcessor, \
     CommandHandler, MessageHandler, filters
 
-from src.guide import Guide
+from src.guide import Guide, RouteLeg
 
 
 # Custom data type to make the code easier to read:
 Coordinates = NewType(name='Coordinates', tp=Tuple[float, float])  # (lat, lon)
+# (latitude, longitude, cos(latitude)) of a checkpoint
+CheckpointTrig = Tuple[float, float, float]
+
+# Mean Earth radius in meters (same value as the haversine library), and the
+# length of one degree of a great circle (to skip the conversion to radians)
+_EARTH_RADIUS_M = 6371008.8
+_METERS_PER_DEGREE = _EARTH_RADIUS_M * math.pi / 180
+
+# All the possible turning messages (see _get_turning_message)
+_TURNING_MESSAGES = (
+    'Go straight ahead ⬆️',
+    'Half-turn to the left ↖️',
+    'Half-turn to the right ↗️',
+    'Turn to the left ⬅️',
+    'Turn to the right ➡️',
+    'Sharp turn to the left ↙️',
+    'Sharp turn to the right ↘️',
+)
+
+# Keys of the user data that describe the programmed route of the user
+_ROUTE_KEYS = (
+    'directions', 'dst_name', 'current_leg', 'route'
+)
+
+# MESSAGES (static messages and templates to fill with str.format):
+_START_TEMPLATE = (
+    "Hello {name}! 👋\n\n"
+    "Don't get lost anymore 🌍,\nGuideMateBot will help you! 🧭\n\n"
+    "Please, use the /help command to get more information 🙌\n\n"
+    "If you already know how to use this Bot, share your location📍 and"
+    " use the /go command 😎!"
+)
+_HELP_MESSAGE = (
+    "Dont' know how to use this bot? Don't worry! "
+    "I'm here to give you a hand 😉!\n\n"
+    "/start -> sends a welcome message 👋\n"
+    "/help -> gives you the basic instructions 🙌\n"
+    "/where -> tells you where you are now 🏙️\n"
+    "/cancel -> cancels the programmed route ❎\n"
+    "/go <destination> -> This Bot will guide you from your current "
+    "position to your _destination_📍\n\n\n"
+    "❗ IMPORTANT NOTE ❗:\n\n"
+    "For this Bot to work well, you must share your location 🛰️. "
+    "Make sure to do this before calling the /go command 👍"
+)
+_WHERE_TEMPLATE = (
+    "You are here📍:\n\nCountry: {country}\n"
+    "City: {city}, ({postcode})\n"
+    "Type: {osm_value}, {type}\n"
+    "Street Name: {name}\n"
+    "Coordinates: {coords}"
+)
+_CHECKPOINT_TEMPLATE = (
+    "Well done! You've reached checkpoint #{leg}! 👏\n"
+    "You are at {src} 📍\n\n"
+    "Go to the next checkpoint #{next_leg}:\n"
+    "Coordinates: {mid} 📍\n"
+)
+_FINAL_TEMPLATE = (
+    'Congratulations {name} 👏 !!!\n'
+    'You are at {destination} 📍\n\n'
+    'Our trip is over, no more checkpoints left 😉\n'
+    'Thanks for trusting me 🤝,\n'
+    'See you soon 😉!'
+)
+# Message sent when the location of the user can not be processed
+_GPS_PROBLEM_MESSAGE = (
+    "There is a problem with your GPS signal 🛰😵\n\n"
+    "I am trying to fix it...\n"
+    "Please, check that everything is okay.\n"
+    "You may have to share your location again."
+)
+# Message sent when the graph (map) of the city of the user is not available
+_CITY_PROBLEM_MESSAGE = (
+    "Sorry, I can't get the map of your city 🗺😵\n\n"
+    "I won't be able to guide you there for now."
+)
 
 
 # GLOBAL OBJECTS:
@@ -31,10 +118,150 @@ GUIDE = Guide()
 GEOLOCATOR = Photon()
 
 
+@dataclass
+class Route:
+    """
+    Programmed route of a user, stored as a Structure of Arrays (SoA): the
+    i-th element of every field describes the i-th leg of the route, from its
+    source point (src) to its checkpoint (mid). The last checkpoint is the
+    destination. Built from the directions computed by the Guide.
+    """
+
+    srcs: np.ndarray  # (lat, lon) of the source of every leg, shape (N, 2)
+    mids: np.ndarray  # (lat, lon) of every checkpoint, shape (N, 2)
+    cos_lats: np.ndarray  # cos(latitude) of every checkpoint, shape (N,)
+    lengths: np.ndarray  # length of every leg [in meters] (NaN if unknown)
+    angles: np.ndarray  # turning angle at every checkpoint (NaN if unknown)
+    current_names: List[Optional[str]]  # street name from src to mid
+    next_names: List[Optional[str]]  # street name from mid to the next one
+
+    @classmethod
+    def from_directions(cls, directions: List[RouteLeg]) -> 'Route':
+        """
+        Build a Route from the directions (legs) computed by the Guide.
+
+        :param directions: Sequence of legs that form the route
+        :return: Route instance
+        """
+
+        mids = np.array([leg.mid for leg in directions], dtype=np.float64)
+        return cls(
+            srcs=np.array([leg.src for leg in directions], dtype=np.float64),
+            mids=mids,
+            cos_lats=np.cos(np.radians(mids[:, 0])),
+            lengths=np.array(
+                [leg.length for leg in directions], dtype=np.float64
+            ),  # NOTE: None is converted to NaN
+            angles=np.array(
+                [leg.angle for leg in directions], dtype=np.float64
+            ),  # NOTE: None is converted to NaN
+            current_names=[leg.current_name for leg in directions],
+            next_names=[leg.next_name for leg in directions],
+        )
+
+    def __len__(self) -> int:
+        """
+        :return: number of legs (and checkpoints) of the route
+        """
+
+        return len(self.mids)
+
+    def checkpoint_trig(self, i: int) -> CheckpointTrig:
+        """
+        :param i: index of the checkpoint
+        :return: (latitude, longitude, cos(latitude)) of the i-th checkpoint
+        """
+
+        lat, lon = self.mids[i].tolist()
+        return lat, lon, float(self.cos_lats[i])
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Update processor that handles the updates of different users concurrently
+    (so a slow geocoding or graph loading does not block the other users), but
+    the updates of the same user one at a time and in order of arrival: the
+    handlers read and write the user data (e.g. current_leg) across awaits.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        """
+        Initialize a PerUserUpdateProcessor instance.
+
+        :param max_concurrent_updates: max number of updates processed at once
+        :return: None
+        """
+
+        super().__init__(max_concurrent_updates=max_concurrent_updates)
+        # user ID -> lock. NOTE that a lock is dropped as soon as no update of
+        # its user is being processed (or waiting)
+        self._user_locks = weakref.WeakValueDictionary()
+
+    async def do_process_update(
+            self,
+            update: object,
+            coroutine: Awaitable[Any]
+    ) -> None:
+        """
+        Process the given update once the previous updates of the same user
+        have been processed.
+
+        :param update: the update to be processed
+        :param coroutine: coroutine that processes the update
+        :return: None
+        """
+
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:  # the update does not belong to a user
+            await coroutine
+            return
+
+        lock = self._user_locks.get(user.id)
+        if lock is None:
+            lock = self._user_locks[user.id] = asyncio.Lock()
+        # NOTE that asyncio.Lock wakes up its waiters in FIFO order
+        async with lock:
+            await coroutine
+
+    async def initialize(self) -> None:
+        """
+        Nothing to initialize (required by BaseUpdateProcessor).
+
+        :return: None
+        """
+
+    async def shutdown(self) -> None:
+        """
+        Nothing to shut down (required by BaseUpdateProcessor).
+
+        :return: None
+        """
+
+
+def _eq_dist_m(point: Coordinates, checkpoint_trig: CheckpointTrig) -> float:
+    """
+    Equirectangular approximation of the distance in meters between a point
+    and a checkpoint, given the precomputed trigonometric values of the
+    checkpoint. At the scale of the checks done on every location update
+    (meters to a few kilometers) it is as accurate as the haversine distance,
+    but it needs no trigonometric function at all.
+
+    :param point: (x,y) coordinates of the point
+    :param checkpoint_trig: (latitude, longitude, cos(latitude)) of the
+        checkpoint (see Route.checkpoint_trig)
+    :return: distance between the point and the checkpoint [in meters]
+    """
+
+    lat2, lon2, cos_lat2 = checkpoint_trig
+    d_lat = point[0] - lat2  # [in degrees]
+    d_lon = (point[1] - lon2) * cos_lat2  # [in degrees]
+    return _METERS_PER_DEGREE * math.sqrt(d_lat * d_lat + d_lon * d_lon)
+
+
 def _is_moving_away_from_the_route(
         current_coords: Coordinates,
         last_coords: Coordinates,
-        checkpoint: Coordinates,
+        checkpoint_trig: CheckpointTrig,
         margin: int = 15,
 ) -> bool:
     """
@@ -45,34 +272,95 @@ def _is_moving_away_from_the_route(
 
     :param current_coords: (x,y) coordinates. The current coords of the user
     :param last_coords: (x,y) coordinates. The last recorded coords of the user
-    :param checkpoint: (x,y) coordinates of the next checkpoint in the route
+    :param checkpoint_trig: precomputed values of the next checkpoint in the
+        route (see Route.checkpoint_trig)
     :param margin: distance difference to consider that the user is moving away
     :return: True if the user is moving away from the next checkpoint
     """
 
-    last_distance = haversine(last_coords, checkpoint, unit='m')
-    current_distance = haversine(current_coords, checkpoint, unit='m')
+    last_distance = _eq_dist_m(last_coords, checkpoint_trig)
+    current_distance = _eq_dist_m(current_coords, checkpoint_trig)
     return current_distance > last_distance + margin
 
 
-def _are_next_to_each_other(
-        p1: Coordinates,
-        p2: Coordinates,
-        margin: int = 15
-) -> bool:
+def _get_reached_checkpoint(
+        point: Coordinates,
+        route: Route,
+        first: int,
+        margin: int = 15,
+        lookahead: int = 5
+) -> Optional[int]:
     """
-    Checks whether the distance between two geographic coordinates (p1 and p2)
-    is lower than a given threshold (<margin>) [in meters]. If that is the
-    case, the points are considered to be "next to each other".
-
-    :param p1: (x,y) coordinates of the first point
-    :param p2: (x,y) coordinates of the second point
+    Checks whether the given point is next to (closer than a given threshold
+    <margin> [in meters]) one of the upcoming checkpoints: the <first> one and
+    the following ones (up to <lookahead> checkpoints in total). The distances
+    are computed all at once (vectorized equirectangular approximation).
+    This way, the user may skip some checkpoints of the route.
+
+    :param point: (x,y) coordinates of the point
+    :param route: programmed route of the user
+    :param first: index of the next checkpoint of the route
     :param margin: distance threshold to define closeness [in meters]
-    :return: True if the two points are closer than a given distance (margin)
+    :param lookahead: number of upcoming checkpoints to check
+    :return: index of the closest reached checkpoint, or None if there is none
+    """
+
+    upcoming = slice(first, first + lookahead)
+    mids, cos_lats = route.mids[upcoming], route.cos_lats[upcoming]
+    d_lat = point[0] - mids[:, 0]  # [in degrees]
+    d_lon = (point[1] - mids[:, 1]) * cos_lats  # [in degrees]
+    distances = _METERS_PER_DEGREE * np.sqrt(d_lat * d_lat + d_lon * d_lon)
+    closest = int(np.argmin(distances))
+    return first + closest if distances[closest] <= margin else None
+
+
+@functools.lru_cache(maxsize=1024)
+def _reverse_geocode(lat: float, lon: float) -> Dict[str, Any]:
+    """
+    Reverse geocode the given coordinates (Photon). The results are memoized,
+    so use coordinates rounded to 4 decimals (~11 meters) as input to reuse
+    them for nearby locations (see _reverse_geocode_rounded).
+
+    :param lat: latitude of the location
+    :param lon: longitude of the location
+    :raise GeocoderQueryError: if the location is not found
+    :return: properties of the location (city, country, street name, etc.)
+    """
+
+    location = GEOLOCATOR.reverse((lat, lon))
+    if location is None or 'properties' not in location.raw:
+        raise GeocoderQueryError(f'Location ({lat}, {lon}) not found')
+    return location.raw['properties']
+
+
+def _reverse_geocode_rounded(coords: Coordinates) -> Dict[str, Any]:
+    """
+    Reverse geocode the given coordinates, rounded to 4 decimals (~11 meters)
+    to reuse the memoized result of previous queries (see _reverse_geocode).
+
+    :param coords: (x,y) coordinates of the location
+    :raise GeocoderQueryError: if the location is not found
+    :return: properties of the location (city, country, street name, etc.)
     """
 
-    distance = haversine(point1=p1, point2=p2, unit='m')
-    return distance <= margin
+    return _reverse_geocode(round(coords[0], 4), round(coords[1], 4))
+
+
+@functools.lru_cache(maxsize=1024)
+def _geocode(query: str) -> Coordinates:
+    """
+    Geocode the given query (Photon). The results are memoized, so use a
+    lowercase query to reuse them regardless of the case.
+
+    :param query: name of the place to geocode
+    :raise GeocoderQueryError: if the place is not found
+    :return: (x,y) coordinates of the place
+    """
+
+    geoinfo = GEOLOCATOR.geocode(query=query)
+    if geoinfo is None:
+        raise GeocoderQueryError(f"Place '{query}' not found")
+    return geoinfo.latitude, geoinfo.longitude
 
 
 def _round5(n: float) -> int:
@@ -84,8 +372,7 @@ def _round5(n: float) -> int:
     :return: the multiple of 5 that is closer to the given number <n>
     """
 
-    n5 = int((n // 5) * 5)
-    return n5 if n % 5 <= 2 else n5 + 5
+    return int((n + 2.5) // 5) * 5  # branchless: a single floor division
 
 
 def _get_turning_message(angle: Optional[float]) -> str:
@@ -105,20 +392,14 @@ def _get_turning_message(angle: Optional[float]) -> str:
     :return: the message
     """
 
-    if abs(angle) < 22.5 or angle is None:
-        message_ = 'Go straight ahead ⬆️'
-    else:
-        dir_ = 'left' if angle < 0 else 'right'  # direction
-        if abs(angle) < 67.5:
-            sym_ = '↗️' if dir_ == 'right' else '↖️'
-            message_ = f'Half-turn to the {dir_} {sym_}'
-        elif abs(angle) < 112.5:
-            sym_ = '➡️' if dir_ == 'right' else '⬅️'
-            message_ = f'Turn to the {dir_} {sym_}'
-        else:  # > 112.5 (but <= 180 by definition)
-            sym_ = '↘️' if dir_ == 'right' else '↙️'
-            message_ = f'Sharp turn to the {dir_} {sym_}'
-    return message_
+    if angle is None:
+        return _TURNING_MESSAGES[0]
+    abs_angle = abs(angle)
+    if abs_angle < 22.5:
+        return _TURNING_MESSAGES[0]
+    # (half-turn, turn, sharp turn) x (left, right). NOTE: abs_angle <= 180
+    turn_type = min(int((abs_angle - 22.5) // 45), 2)
+    return _TURNING_MESSAGES[1 + (angle > 0) + 2 * turn_type]
 
 
 def _get_next_checkpoint_message(user_data: Dict[str, Any]) -> str:
@@ -129,33 +410,32 @@ def _get_next_checkpoint_message(user_data: Dict[str, Any]) -> str:
     NOTE: this message must be sent when the user reaches the n-th checkpoint
     and want to reach the (n+1)-th checkpoint.
 
-    :param user_data: Dictionary with the user data (directions, current step)
+    :param user_data: Dictionary with the user data (route, current step)
     :return: message informing the user on how to reach the next checkpoint
     """
 
     # Unpack user data
     current_leg = user_data['current_leg']  # already updated for next step
-    current_route_leg = user_data['directions'][current_leg]
-    src, mid = current_route_leg['src'], current_route_leg['mid']
+    route = user_data['route']
+    src = tuple(route.srcs[current_leg].tolist())
+    mid = tuple(route.mids[current_leg].tolist())
 
     # Create the first part of the message
-    message = (
-        f"Well done! You've reached checkpoint #{current_leg}! 👏\n"
-        f"You are at {src} 📍\n\n"
-        f"Go to the next checkpoint #{current_leg+1}:\n"
-        f"Coordinates: {mid} 📍\n"
-    )
+    message = _CHECKPOINT_TEMPLATE.format_map({
+        'leg': current_leg, 'next_leg': current_leg + 1, 'src': src, 'mid': mid
+    })
     # If the next street name is available, add it
-    if current_route_leg['next_name'] is not None:
-        message += f'Street Name: {current_route_leg["next_name"]}\n'
+    next_name = route.next_names[current_leg]
+    if next_name is not None:
+        message += f'Street Name: {next_name}\n'
     message += '\n'
     # If the next distance to walk or drive is not available, compute it
-    distance = current_route_leg['length']
-    if distance is None:
+    distance = float(route.lengths[current_leg])
+    if math.isnan(distance):
         distance = haversine(src, mid, unit='m')
     distance = _round5(n=distance)
 
-    if current_route_leg['dst'] is None:
+    if current_leg + 1 == len(route):
         # The next checkpoint is the destination!
         message += (
             "Your destination is close to you!\n"
@@ -163,19 +443,85 @@ def _get_next_checkpoint_message(user_data: Dict[str, Any]) -> str:
         )
     else:  # Give instructions on how to reach the next checkpoint
         # Try to get the current street name
-        current_street = current_route_leg['current_name']
+        current_street = route.current_names[current_leg]
         if current_street is None:
             current_street = "the street"
         # Tell the user how many meters he/she has to walk/drive
         message += f"Go straight through {current_street} {distance} meters"
-        if (current_route_leg['angle'] is not None
-                and abs(current_route_leg['angle']) > 22.5):
-            turning_m = _get_turning_message(current_route_leg['angle'])
+        angle = float(route.angles[current_leg])
+        if not math.isnan(angle) and abs(angle) > 22.5:
+            turning_m = _get_turning_message(angle)
             message += f' and {turning_m.lower()}'
 
     return message
 
 
+async def _run_in_thread(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking function (HTTP, I/O, CPU) in a worker thread of the default
+    executor of the event loop, so that the bot keeps serving other updates.
+    Same as asyncio.to_thread, which is not available in Python 3.8.
+
+    :param func: blocking function to call
+    :param args: positional arguments of the function
+    :param kwargs: keyword arguments of the function
+    :return: the value returned by the function
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(func, *args, **kwargs)
+    )
+
+
+async def _send_route_image(
+        context: ContextTypes.DEFAULT_TYPE,
+        user_id: int,
+        leg_id: int,
+        texts: Sequence[str] = ()
+) -> None:
+    """
+    Sends the image of the programmed route of the user, at the given leg.
+    The image is rendered in memory (no disk I/O), in a thread, while the
+    given text messages are sent (concurrently). The image is sent after them.
+
+    :param context: provides access to common objects in handler callbacks
+    :param user_id: ID of the user to send the image to
+    :param leg_id: index of the current leg of the route
+    :param texts: messages to send (in order) before the image
+    :return: None. The messages and a photo are sent to the user.
+    """
+
+    photo, _ = await asyncio.gather(
+        _run_in_thread(
+            GUIDE.plot_directions,
+            directions=context.user_data['directions'],
+            current_leg=leg_id,
+            walk_or_drive='drive'
+        ),
+        _send_messages(context=context, user_id=user_id, texts=texts)
+    )
+    await context.bot.send_photo(chat_id=user_id, photo=photo)
+
+
+async def _send_messages(
+        context: ContextTypes.DEFAULT_TYPE,
+        user_id: int,
+        texts: Sequence[str]
+) -> None:
+    """
+    Sends the given text messages to the user, in order.
+
+    :param context: provides access to common objects in handler callbacks
+    :param user_id: ID of the user to send the messages to
+    :param texts: messages to send
+    :return: None. The messages are sent to the user.
+    """
+
+    for text in texts:
+        await context.bot.send_message(chat_id=user_id, text=text)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Starts the conversation. Command: /start.
@@ -186,16 +532,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
 
     # Reset the user data, just in case
-    for v in ('directions', 'dst_name', 'current_leg', 'route_id'):
-        if v in context.user_data:
-            del context.user_data[v]
-    message = (
-        f"Hello {update.effective_chat.first_name}! 👋\n\n"
-        "Don't get lost anymore 🌍,\nGuideMateBot will help you! 🧭\n\n"
-        "Please, use the /help command to get more information 🙌\n\n"
-        "If you already know how to use this Bot, share your location📍 and"
-        " use the /go command 😎!"
-    )
+    for v in _ROUTE_KEYS:
+        context.user_data.pop(v, None)
+    message = _START_TEMPLATE.format(name=update.effective_chat.first_name)
     user_id = update.effective_user.id  # get the user_id to send messages
     await context.bot.send_message(chat_id=user_id, text=message)
 
@@ -210,22 +549,8 @@ async def help_(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     :return: None. A message is sent to the user.
     """
 
-    message = (
-        "Dont' know how to use this bot? Don't worry! "
-        "I'm here to give you a hand 😉!\n\n"
-        "/start -> sends a welcome message 👋\n"
-        "/help -> gives you the basic instructions 🙌\n"
-        "/where -> tells you where you are now 🏙️\n"
-        "/cancel -> cancels the programmed route ❎\n"
-        "/go <destination> -> This Bot will guide you from your current "
-        "position to your _destination_📍\n\n\n"
-        "❗ IMPORTANT NOTE ❗:\n\n"
-        "For this Bot to work well, you must share your location 🛰️. "
-        "Make sure to do this before calling the /go command 👍"
-
-    )
     user_id = update.effective_user.id  # get the user_id to send messages
-    await context.bot.send_message(chat_id=user_id, text=message)
+    await context.bot.send_message(chat_id=user_id, text=_HELP_MESSAGE)
 
 
 async def where(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -242,25 +567,32 @@ async def where(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
 
     user_id = update.effective_user.id  # get the user_id to send messages
-    try:
-        # try to get the user location (if he/she is sharing his/her location)
-        user_coords = context.user_data['current_location']
-        info = GEOLOCATOR.reverse(user_coords).raw['properties']
-        message = (
-            f"You are here📍:\n\nCountry: {info.get('country')}\n"
-            f"City: {info.get('city')}, ({info.get('postcode')})\n"
-            f"Type: {info.get('osm_value')}, {info.get('type')}\n"
-            f"Street Name: {info.get('name')}\n"
-            f"Coordinates: {user_coords}"
-        )
-        await context.bot.send_message(chat_id=user_id, text=message)
-    except:
-        # It may be that 'current_location' is not in <context.user_data>
+    # Get the user location (if he/she is sharing his/her location)
+    user_coords = context.user_data.get('current_location')
+    info = None
+    if user_coords is not None:
+        try:
+            # Run blocking calls (HTTP, CPU) in a thread: do not block the bot
+            info = await _run_in_thread(
+                _reverse_geocode_rounded, user_coords
+            )
+        except GeopyError as e:  # location not found
+            print(e)
+
+    if info is None:
         message = (
             "I don't know where you are...\n"
             "Please, share your location with me📍"
         )
         await context.bot.send_message(chat_id=user_id, text=message)
+        return
+
+    message = _WHERE_TEMPLATE.format(
+        country=info.get('country'), city=info.get('city'),
+        postcode=info.get('postcode'), osm_value=info.get('osm_value'),
+        type=info.get('type'), name=info.get('name'), coords=user_coords
+    )
+    await context.bot.send_message(chat_id=user_id, text=message)
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -281,17 +613,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
 
     user_id = update.effective_user.id  # get the user_id to send messages
-    try:  # If there is an ongoing route, remove it from the user data
-        del context.user_data['directions']
-        del context.user_data['dst_name']
-        del context.user_data['current_leg']
-        del context.user_data['route_id']
-        message = (
-            "Your rute has been canceled ❎\n"
-            "Use the /go command to create a new one 🗺️\n"
-        )
-        await context.bot.send_message(chat_id=user_id, text=message)
-    except:
+    if 'directions' not in context.user_data:
         # There are no programmed routes for this user.
         message = (
             "You don't have any programmed route 💭\n\n"
@@ -299,6 +621,16 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "Make sure you are sharing your location!"
         )
         await context.bot.send_message(chat_id=user_id, text=message)
+        return
+
+    # There is an ongoing route, remove it from the user data
+    for v in _ROUTE_KEYS:
+        context.user_data.pop(v, None)
+    message = (
+        "Your rute has been canceled ❎\n"
+        "Use the /go command to create a new one 🗺️\n"
+    )
+    await context.bot.send_message(chat_id=user_id, text=message)
 
 
 async def go(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -314,76 +646,75 @@ async def go(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
 
     user_id = update.effective_user.id  # get the user_id to send message
-    try:
-        if not context.args:  # If the destination is not provided
-            raise Exception("EmptyInputDestinationError")
-        if 'directions' in context.user_data:  # If he/she already has a route
-            raise Exception('AlreadyHasRouteError')
-        if 'current_location' not in context.user_data:
-            raise Exception('NoLocationFoundError')
-
-        # Turn the destination name into coordinates and compute the route
-        current_coords = context.user_data['current_location']
-        destination_name = ' '.join(context.args)
-        context.user_data['dst_name'] = destination_name
-        dst_place = destination_name + ', ' + GUIDE.city
-        dst_geoinfo = GEOLOCATOR.geocode(query=dst_place)
-        dst_coords = (dst_geoinfo.latitude, dst_geoinfo.longitude)
-
-        # Compute the route: shortest path to the given destination
-        directions = GUIDE.get_directions(
-            src_coords=current_coords, dst_coords=dst_coords
+    if not context.args:  # If the destination is not provided
+        message = "Please, insert your destination after /go"
+        await context.bot.send_message(chat_id=user_id, text=message)
+        return
+    if 'directions' in context.user_data:  # If he/she already has a route
+        message = (
+            "You are already following a route! 😅\n\nIf you want to "
+            "delete it and start a new one, use the /cancel command."
         )
-
-        context.user_data['directions'] = directions  # save the route
-        # Create a route_id from the current timestamp
-        context.user_data['route_id'] = datetime.now().strftime("%H%M%S")
-
-        # Send image showing the route to follow
-        img_filepath = GUIDE.plot_directions(
-            directions=directions,
-            current_leg=0,
-            file_name=f'{context.user_data["route_id"]}_0.png'
+        await context.bot.send_message(chat_id=user_id, text=message)
+        return
+    if 'current_location' not in context.user_data:
+        message = (
+            "I don't know where you are 😅\n\nPlease, share your "
+            "location with me, so I can guide you wherever you want! 🌎"
         )
-        await context.bot.send_photo(chat_id=user_id, photo=img_filepath)
-
-        # Send the first text message
-        first_leg = context.user_data['directions'][0]
-        first_src, first_mid = first_leg['src'], first_leg['mid']
-
-        # The user must go to the first checkpoint
-        context.user_data['current_leg'] = 0
+        await context.bot.send_message(chat_id=user_id, text=message)
+        return
+    if 'place' not in context.user_data:  # no graph of the user's city
+        await context.bot.send_message(
+            chat_id=user_id, text=_CITY_PROBLEM_MESSAGE
+        )
+        return
+
+    # Turn the destination name into coordinates and compute the route
+    current_coords = context.user_data['current_location']
+    destination_name = ' '.join(context.args)
+    # Look for the destination in the city of the user ('<city>, <country>')
+    place = context.user_data['place']
+    dst_place = destination_name + ', ' + place.split(',')[0]
+    try:
+        # NOTE: blocking calls (HTTP, CPU) run in a thread (_run_in_thread)
+        dst_coords = await _run_in_thread(_geocode, dst_place.lower())
+        # Compute the route: shortest path to the given destination, on the
+        # graph of the city of the user (shared by all the users in it)
+        directions = await _run_in_thread(
+            GUIDE.get_directions,
+            src_coords=current_coords, dst_coords=dst_coords,
+            place=place, walk_or_drive='drive'
+        )
+    except (GeopyError, NetworkXNoPath) as e:
+        # The destination is not found, or there is no path to it
+        print(e)
         message = (
-            f'You are at {first_src}\n\n'
-            f'Go to the first Checkpoint #1:\n {first_mid}\n'
+            'Your destination is not reachable.\n'
+            'Please, try another one.'
         )
-        if first_leg['next_name'] is not None:
-            message += f'Street name: {first_leg["next_name"]}'
         await context.bot.send_message(chat_id=user_id, text=message)
+        return
 
-    except Exception as e:
-        print(e)
-        if str(e) == 'EmptyInputDestinationError':
-            message = "Please, insert your destination after /go"
-            await context.bot.send_message(chat_id=user_id, text=message)
-        elif str(e) == "AlreadyHasRouteError":
-            message = (
-                "You are already following a route! 😅\n\nIf you want to "
-                "delete it and start a new one, use the /cancel command."
-            )
-            await context.bot.send_message(chat_id=user_id, text=message)
-        elif str(e) == 'NoLocationFoundError':
-            message = (
-                "I don't know where you are 😅\n\nPlease, share your "
-                "location with me, so I can guide you wherever you want! 🌎"
-            )
-            await context.bot.send_message(chat_id=user_id, text=message)
-        else:
-            message = (
-                'Your destination is not reachable.\n'
-                'Please, try another one.'
-            )
-            await context.bot.send_message(chat_id=user_id, text=message)
+    context.user_data['dst_name'] = destination_name
+    context.user_data['directions'] = directions  # save the route
+    # The user must go to the first checkpoint
+    context.user_data['current_leg'] = 0
+    context.user_data['route'] = Route.from_directions(directions=directions)
+
+    # Send image showing the route to follow
+    await _send_route_image(context=context, user_id=user_id, leg_id=0)
+
+    # Send the first text message
+    first_leg = directions[0]
+    first_src, first_mid = first_leg.src, first_leg.mid
+    message = (
+        f'You are at {first_src}\n\n'
+        f'Go to the first Checkpoint #1:\n {first_mid}\n'
+    )
+    if first_leg.next_name is not None:
+        message += f'Street name: {first_leg.next_name}'
+    await context.bot.send_message(chat_id=user_id, text=message)
 
 
 async def process_user_location(
@@ -404,151 +735,161 @@ async def process_user_location(
     """
 
     user_id = update.effective_user.id
-    try:
-        # Try to get the current location (latitude, longitude) of the user.
-        if update.edited_message:
-            message = update.edited_message
-        else:
-            message = update.message
-        current_loc = (message.location.latitude, message.location.longitude)
-
-        if 'current_location' not in context.user_data:
-            # This is the first location received from the user.
-            context.user_data['current_location'] = current_loc
-            loc_geoinfo = GEOLOCATOR.reverse(current_loc).raw['properties']
-            place = loc_geoinfo['city'] + ', ' + loc_geoinfo['country']
-            GUIDE.get_graph(place=place, walk_or_drive='drive')
-            message = (
-                'Great! 👍\nNow that I have your location, '
-                'I can take you wherever you want! 🌍'
-                'Just use the /go command 😉'
-            )
-            await context.bot.send_message(chat_id=user_id, text=message)
-            return  # there is no route yet, nothing left to do
+    # Get the current location (latitude, longitude) of the user.
+    message = update.edited_message or update.message
+    if message is None or message.location is None:
+        # The user is sharing the location but the bot doesn't receive it
+        await context.bot.send_message(
+            chat_id=user_id, text=_GPS_PROBLEM_MESSAGE
+        )
+        return
+    current_loc = (message.location.latitude, message.location.longitude)
 
-        # Save the current location of the user in the 'user_data' dictionary
-        # in the 'context' object. Keep the last_location at hand.
-        last_location = context.user_data['current_location']
+    if 'current_location' not in context.user_data:
+        # This is the first location received from the user.
+        # NOTE that it is saved right away, so that a city that can not be
+        # found (or downloaded) is not retried on every location update
         context.user_data['current_location'] = current_loc
-
-        # When a user has a programmed route,
-        # they have a 'directions' key in their data.
-        user_data = context.user_data
-        if 'directions' in user_data:
-            # There is a programmed route. Let's check that the user is
-            # approaching the next checkpoint, and the instructions will be
-            # updated depending on the user's progress.
-            directions, i = user_data['directions'], user_data['current_leg']
-            checkpoint = directions[i]['mid']  # the next checkpoint
-
-            # First, let's check that the user is not moving away from the
-            # programmed route. In other words, let's check that the user is
-            # getting closer to the next checkpoint.
-            is_moving_away = _is_moving_away_from_the_route(
-                current_coords=context.user_data['current_location'],
-                last_coords=last_location,
-                checkpoint=checkpoint
+        try:
+            # NOTE: blocking calls (HTTP, I/O) run in a thread
+            loc_geoinfo = await _run_in_thread(
+                _reverse_geocode_rounded, current_loc
+            )
+            place = loc_geoinfo['city'] + ', ' + loc_geoinfo['country']
+        except (KeyError, GeopyError) as e:
+            # The location (city) could not be found
+            print(e)
+            await context.bot.send_message(
+                chat_id=user_id, text=_GPS_PROBLEM_MESSAGE
             )
-            if is_moving_away:
-                # The user is moving away from the next checkpoint.
-                # A warning message is required to let him/her know that.
-                warning = (
-                    "⚠️ Be careful ⚠️\n\n"
-                    "You may be moving away from the next checkpoint ❗️"
+            return
+        try:
+            # Graphs are saved on disk and shared in memory by all the users
+            # of the same city (see Guide), so they are only loaded (or
+            # downloaded) for a new city
+            if not Guide.is_graph_loaded(place=place, walk_or_drive='drive'):
+                await _run_in_thread(
+                    Guide.load_graph, place=place, walk_or_drive='drive'
                 )
-                await context.bot.send_message(chat_id=user_id, text=warning)
-
-            elif _are_next_to_each_other(p1=current_loc, p2=checkpoint):
-                # The user has reached the checkpoint. Send a message informing
-                # about this milestone. If the checkpoint is the destination,
-                # send the final message (congratulation). Else, send further
-                # instructions to reach the next checkpoint.
-
-                if i+1 == len(directions):
-                    img_filepath = GUIDE.plot_directions(
-                        directions=user_data['directions'],
-                        current_leg=i+1,
-                        file_name=f'{user_data["route_id"]}_{i+1}.png'
-                    )
-                    await context.bot.send_photo(
-                        chat_id=user_id, photo=img_filepath
-                    )
-
-                    # We've already reached our destination! send final message
-                    user_name = update.effective_chat.first_name
-                    destination_name = context.user_data['dst_name']
-
-                    final_m = (
-                        f'Congratulations {user_name} 👏 !!!\n'
-                        f'You are at {destination_name} 📍\n\n'
-                        f'Our trip is over, no more checkpoints left 😉\n'
-                        'Thanks for trusting me 🤝,\n'
-                        'See you soon 😉!'
-                    )
-                    await context.bot.send_message(
-                        chat_id=user_id, text=final_m
-                    )
-                    # Finally, remove everything related to this finished route
-                    del context.user_data['directions']
-                    del context.user_data['dst_name']
-                    del context.user_data['current_leg']
-                    del context.user_data['route_id']
-
-                else:  # next checkpoint reached (it is not the destination)
-
-                    # Send message with info to reach the next checkpoint
-                    message = _get_next_checkpoint_message(
-                        user_data=context.user_data
-                    )
-                    await context.bot.send_message(
-                        chat_id=user_id, text=message
-                    )
-
-                    if directions[i]['angle'] is not None:
-                        # If possible, we will remind the user of their
-                        # turning direction
-                        turn_ = _get_turning_message(directions[i]['angle'])
-                        await context.bot.send_message(
-                            chat_id=user_id, text=turn_
-                        )
-
-                    # Advance the step counter
-                    context.user_data['current_leg'] += 1
-                    leg_id = context.user_data['current_leg']
-                    img_filepath = GUIDE.plot_directions(
-                        directions=user_data['directions'],
-                        current_leg=leg_id,
-                        file_name=f'{user_data["route_id"]}_{leg_id}.png'
-                    )
-                    await context.bot.send_photo(
-                        chat_id=user_id, photo=img_filepath
-                    )
-            # ELSE: do nothing, wait until he/she moves to a different position
-
-    except Exception as e:
-        # When: the user is sharing the location but the bot doesn't receive it
-        print(e)
+        except (ValueError, TypeError, OSError) as e:
+            # The graph of the city could not be downloaded (see Graph). NOTE
+            # that network errors (e.g. from requests) are OSError subclasses
+            print(e)
+            await context.bot.send_message(
+                chat_id=user_id, text=_CITY_PROBLEM_MESSAGE
+            )
+            return
+        # Routes of this user are computed on the graph of their city
+        context.user_data['place'] = place
         message = (
-            "There is a problem with your GPS signal 🛰😵\n\n"
-            "I am trying to fix it...\n"
-            "Please, check that everything is okay.\n"
-            "You may have to share your location again."
+            'Great! 👍\nNow that I have your location, '
+            'I can take you wherever you want! 🌍'
+            'Just use the /go command 😉'
         )
         await context.bot.send_message(chat_id=user_id, text=message)
+        return  # there is no route yet, nothing left to do
+
+    # Save the current location of the user in the 'user_data' dictionary
+    # in the 'context' object. Keep the last_location at hand.
+    user_data = context.user_data
+    last_location = user_data['current_location']
+    user_data['current_location'] = current_loc
+
+    # When a user has a programmed route,
+    # they have a 'directions' key in their data.
+    if 'directions' in user_data:
+        # There is a programmed route. Let's check that the user is
+        # approaching the next checkpoint, and the instructions will be
+        # updated depending on the user's progress.
+        route, i = user_data['route'], user_data['current_leg']
+
+        # First, let's check whether the user has reached the next
+        # checkpoint or one of the following ones (skipping some of them)
+        reached = _get_reached_checkpoint(
+            point=current_loc, route=route, first=i
+        )
+        if reached is not None:
+            # Fast-forward to the reached checkpoint (if some were skipped)
+            i = user_data['current_leg'] = reached
+            # The user has reached the checkpoint. Send a message informing
+            # about this milestone. If the checkpoint is the destination,
+            # send the final message (congratulation). Else, send further
+            # instructions to reach the next checkpoint.
+
+            if i+1 == len(route):
+                await _send_route_image(
+                    context=context, user_id=user_id, leg_id=i+1
+                )
+
+                # We've already reached our destination! send final message
+                user_name = update.effective_chat.first_name
+                destination_name = user_data['dst_name']
+
+                final_m = _FINAL_TEMPLATE.format(
+                    name=user_name, destination=destination_name
+                )
+                await context.bot.send_message(
+                    chat_id=user_id, text=final_m
+                )
+                # Finally, remove everything related to this finished route
+                for v in _ROUTE_KEYS:
+                    user_data.pop(v, None)
+
+            else:  # next checkpoint reached (it is not the destination)
+
+                # Send message with info to reach the next checkpoint
+                texts = [_get_next_checkpoint_message(user_data=user_data)]
+                angle = route.angles[i]
+                if not math.isnan(angle):
+                    # If possible, we will remind the user of their
+                    # turning direction
+                    texts.append(_get_turning_message(float(angle)))
+
+                # Advance the step counter
+                leg_id = user_data['current_leg'] = i + 1
+                # The image of the route is rendered while the messages are
+                # being sent, and it is sent after them
+                await _send_route_image(
+                    context=context, user_id=user_id, leg_id=leg_id,
+                    texts=texts
+                )
+
+        # Else, let's check that the user is not moving away from the
+        # programmed route. In other words, let's check that the user is
+        # getting closer to the next checkpoint.
+        elif _is_moving_away_from_the_route(
+                current_coords=current_loc,
+                last_coords=last_location,
+                checkpoint_trig=route.checkpoint_trig(i)
+        ):
+            # The user is moving away from the next checkpoint.
+            # A warning message is required to let him/her know that.
+            warning = (
+                "⚠️ Be careful ⚠️\n\n"
+                "You may be moving away from the next checkpoint ❗️"
+            )
+            await context.bot.send_message(chat_id=user_id, text=warning)
+        # ELSE: do nothing, wait until he/she moves to a different position
 
 
 if __name__ == '__main__':
 
     # 1) Read the token of your bot
     # (you can create it by speaking to the BotFather in the Telegram app)
-    this_file_path = os.path.abspath(__file__)
-    this_project_dir_path = '/'.join(this_file_path.split('/')[:-2])
-    toke_filepath = this_project_dir_path + '/token.txt'
+    toke_filepath = Path(__file__).resolve().parent.parent / 'token.txt'
     with open(toke_filepath, 'r') as token_file:
         token = token_file.read().strip()
 
     # 2) Create the Application and pass it your bot's token.
-    application = Application.builder().token(token).build()
+    # The updates of different users are processed concurrently (the blocking
+    # calls of the handlers run in threads, see _run_in_thread), whereas
+    # the updates of the same user are processed in order
+    application = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor(max_concurrent_updates=64))
+        .build()
+    )
 
     # 3) Enable the different commands available for this Bot
     application.add_handler(CommandHandler("start", start))
@@ -0,0 +1,63 @@
+"""
+Tests of the Guide module.
+"""
+
+import pytest
+
+nx = pytest.importorskip('networkx')
+pytest.importorskip('osmnx')  # required by the Graph module
+
+from src.graph import Graph
+from src.guide import Guide, _GraphIndex
+
+# Length of one degree of latitude [in meters], and cos(41.4º) (Barcelona)
+_M = 1 / 111195
+_COS_LAT = 0.75
+
+
+def _lon(meters: float) -> float:
+    """
+    :param meters: distance to the east of the longitude 2.17º
+    :return: longitude at the given distance (latitude 41.4º)
+    """
+
+    return 2.17 + meters * _M / _COS_LAT
+
+
+def _make_graph(graph: nx.MultiDiGraph) -> Graph:
+    """
+    Wrap the given NetworkX graph in a Graph instance (without downloading).
+
+    :param graph: NetworkX graph with 'x', 'y' and 'length' attributes
+    :return: Graph instance
+    """
+
+    wrapper = Graph.__new__(Graph)
+    wrapper.place, wrapper.network_type = 'Test, Land', 'drive'
+    wrapper.city, wrapper.country = 'Test', 'Land'
+    wrapper.graph = graph
+    wrapper.nodes, wrapper.edges = graph.nodes, graph.edges
+    wrapper.adj, wrapper.pred = graph.adj, graph.pred
+    return wrapper
+
+
+def test_nearest_node_follows_the_nearest_street_on_a_long_block():
+    # A single 830 m street, and a parallel street 60 m to the north with a
+    # node every 80 m. A point 2 m away from the middle of the long street is
+    # much closer to the nodes of the parallel street than to its own nodes.
+    graph = nx.MultiDiGraph()
+    graph.add_node(1, y=41.4, x=_lon(0))
+    graph.add_node(2, y=41.4, x=_lon(830))
+    graph.add_edge(1, 2, length=830.0)
+    for k in range(12):
+        graph.add_node(100 + k, y=41.4 + 60 * _M, x=_lon(80 * k))
+        if k:
+            graph.add_edge(99 + k, 100 + k, length=80.0)
+    index = _GraphIndex(graph=_make_graph(graph))
+
+    near_the_long_street = (41.4 + 2 * _M, _lon(400))
+    assert Guide._get_nearest_node(index, near_the_long_street) == 1
+    near_the_long_street = (41.4 + 2 * _M, _lon(500))
+    assert Guide._get_nearest_node(index, near_the_long_street) == 2
+    near_the_parallel_street = (41.4 + 50 * _M, _lon(410))
+    assert Guide._get_nearest_node(index, near_the_parallel_street) == 105